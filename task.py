@@ -1,12 +1,39 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+import heapq
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Response, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, UniqueConstraint
+from typing import List, Optional, Dict, Tuple
+from sqlalchemy import create_engine, event, bindparam, select, text, Column, Integer, String, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.orm import sessionmaker, relationship, aliased, Session
+from sqlalchemy.pool import QueuePool
 
 DATABASE_URL = "sqlite:///./workflows.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+
+# WAL lets readers proceed while a writer commits; pooled connections keep the page cache warm
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -16,7 +43,7 @@ class Workflow(Base):
     id = Column(Integer, primary_key=True, index=True)
     workflow_str_id = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
-    steps = relationship("Step", back_populates="workflow", cascade="all, delete-orphan")
+    steps = relationship("Step", back_populates="workflow", cascade="all, delete-orphan", order_by="Step.id")
 
 class Step(Base):
     __tablename__ = "steps"
@@ -36,7 +63,10 @@ class Step(Base):
         foreign_keys="Dependency.prerequisite_id",
         back_populates="prerequisite"
     )
-    __table_args__ = (UniqueConstraint('step_str_id', 'workflow_id', name='_step_workflow_uc'),)
+    __table_args__ = (
+        UniqueConstraint('step_str_id', 'workflow_id', name='_step_workflow_uc'),
+        Index('ix_step_wf_strid', 'workflow_id', 'step_str_id'),
+    )
 
 class Dependency(Base):
     __tablename__ = "dependencies"
@@ -45,9 +75,10 @@ class Dependency(Base):
     prerequisite_id = Column(Integer, ForeignKey("steps.id", ondelete="CASCADE"), nullable=False)
     step = relationship("Step", foreign_keys=[step_id], back_populates="prerequisites")
     prerequisite = relationship("Step", foreign_keys=[prerequisite_id], back_populates="dependents")
-    __table_args__ = (UniqueConstraint('step_id', 'prerequisite_id', name='_step_prereq_uc'),)
-
-Base.metadata.create_all(bind=engine)
+    __table_args__ = (
+        UniqueConstraint('step_id', 'prerequisite_id', name='_step_prereq_uc'),
+        Index('ix_dep_prereq', 'prerequisite_id'),
+    )
 
 # Pydantic Schemas
 class WorkflowCreate(BaseModel):
@@ -88,8 +119,18 @@ class WorkflowDetail(BaseModel):
 class ExecutionOrder(BaseModel):
     order: List[str]
 
+# Create tables once per process at startup rather than on import
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any indexes introduced since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    yield
+
 # Dependency
-app = FastAPI(title="Workflow Definition API")
+app = FastAPI(title="Workflow Definition API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Dependency to get DB session
 def get_db():
@@ -99,99 +140,198 @@ def get_db():
     finally:
         db.close()
 
+# Read-only endpoints only need a pooled connection, not a full ORM session
+def get_ro_conn():
+    with engine.connect() as conn:
+        yield conn
+
+# Execution-order cache: workflow_str_id -> (version, serialized body)
+# Versions are bumped after every committed mutation of a workflow
+_version: Dict[str, int] = {}
+_order_cache: Dict[str, Tuple[int, bytes]] = {}
+
+def _bump_version(workflow_str_id: str):
+    _version[workflow_str_id] = _version.get(workflow_str_id, 0) + 1
+
+# Statements are built once at import; per-request values are passed as bind parameters
+_find_wf_id = select(Workflow.id).where(Workflow.workflow_str_id == bindparam("wsid"))
+_find_wf = select(Workflow.id, Workflow.name).where(Workflow.workflow_str_id == bindparam("wsid"))
+_find_step_ids = select(Step.step_str_id, Step.id).where(
+    Step.workflow_id == bindparam("wid"), Step.step_str_id.in_(bindparam("sids", expanding=True))
+)
+_insert_workflow = insert(Workflow).on_conflict_do_nothing(index_elements=["workflow_str_id"]).returning(Workflow.id)
+_insert_step = insert(Step).on_conflict_do_nothing(index_elements=["step_str_id", "workflow_id"]).returning(Step.id)
+_insert_dependencies = insert(Dependency).on_conflict_do_nothing(index_elements=["step_id", "prerequisite_id"])
+_insert_dependency = _insert_dependencies.returning(Dependency.id)
+
 # 1. Create Workflow
-@app.post("/workflows", response_model=WorkflowResponse)
+@app.post("/workflows", responses={200: {"model": WorkflowResponse}})
 def create_workflow(data: WorkflowCreate, db: Session = Depends(get_db)):
-    existing = db.query(Workflow).filter(Workflow.workflow_str_id == data.workflow_str_id).first()
-    if existing:
+    row = db.execute(_insert_workflow, {"workflow_str_id": data.workflow_str_id, "name": data.name}).first()
+    if row is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Workflow ID already exists")
-    wf = Workflow(workflow_str_id=data.workflow_str_id, name=data.name)
-    db.add(wf)
     db.commit()
-    db.refresh(wf)
-    return {"internal_db_id": wf.id, "workflow_str_id": wf.workflow_str_id, "status": "created"}
+    _bump_version(data.workflow_str_id)
+    return ORJSONResponse({"internal_db_id": row.id, "workflow_str_id": data.workflow_str_id, "status": "created"})
 
 # 2. Add Step
-@app.post("/workflows/{workflow_str_id}/steps", response_model=StepResponse)
+@app.post("/workflows/{workflow_str_id}/steps", responses={200: {"model": StepResponse}})
 def add_step(workflow_str_id: str, data: StepCreate, db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.workflow_str_id == workflow_str_id).first()
-    if not wf:
+    wf_id = db.execute(_find_wf_id, {"wsid": workflow_str_id}).scalar_one_or_none()
+    if wf_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workflow not found")
-    existing = db.query(Step).filter(Step.workflow_id == wf.id, Step.step_str_id == data.step_str_id).first()
-    if existing:
+    row = db.execute(
+        _insert_step, {"step_str_id": data.step_str_id, "description": data.description, "workflow_id": wf_id}
+    ).first()
+    if row is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Step ID already exists in this workflow")
-    step = Step(step_str_id=data.step_str_id, description=data.description, workflow_id=wf.id)
-    db.add(step)
     db.commit()
-    db.refresh(step)
-    return {"internal_db_id": step.id, "step_str_id": step.step_str_id, "status": "step_added"}
+    _bump_version(workflow_str_id)
+    return ORJSONResponse({"internal_db_id": row.id, "step_str_id": data.step_str_id, "status": "step_added"})
 
 # 3. Add Dependency with validation
-@app.post("/workflows/{workflow_str_id}/dependencies", response_model=StatusResponse)
+@app.post("/workflows/{workflow_str_id}/dependencies", responses={200: {"model": StatusResponse}})
 def add_dependency(workflow_str_id: str, data: DependencyCreate, db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.workflow_str_id == workflow_str_id).first()
-    if not wf:
+    wf_id = db.execute(_find_wf_id, {"wsid": workflow_str_id}).scalar_one_or_none()
+    if wf_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workflow not found")
     if data.step_str_id == data.prerequisite_step_str_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Self-dependency detected")
-    step = db.query(Step).filter(Step.workflow_id == wf.id, Step.step_str_id == data.step_str_id).first()
-    prereq = db.query(Step).filter(Step.workflow_id == wf.id, Step.step_str_id == data.prerequisite_step_str_id).first()
-    if not step or not prereq:
+    ids = dict(db.execute(
+        _find_step_ids, {"wid": wf_id, "sids": [data.step_str_id, data.prerequisite_step_str_id]}
+    ).all())
+    if len(ids) != 2:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Step or prerequisite not found in workflow")
     # Prevent duplicate dependency
-    existing = db.query(Dependency).filter(Dependency.step_id == step.id, Dependency.prerequisite_id == prereq.id).first()
-    if existing:
+    row = db.execute(
+        _insert_dependency,
+        {"step_id": ids[data.step_str_id], "prerequisite_id": ids[data.prerequisite_step_str_id]},
+    ).first()
+    if row is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Dependency already exists")
-    dep = Dependency(step_id=step.id, prerequisite_id=prereq.id)
-    db.add(dep)
     db.commit()
-    return {"status": "dependency_added"}
+    _bump_version(workflow_str_id)
+    return ORJSONResponse({"status": "dependency_added"})
+
+# 3b. Add Dependencies in bulk with a single commit
+@app.post("/workflows/{workflow_str_id}/dependencies:bulk", responses={200: {"model": StatusResponse}})
+def add_dependencies_bulk(workflow_str_id: str, data: List[DependencyCreate], db: Session = Depends(get_db)):
+    wf_id = db.execute(_find_wf_id, {"wsid": workflow_str_id}).scalar_one_or_none()
+    if wf_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workflow not found")
+    if any(d.step_str_id == d.prerequisite_step_str_id for d in data):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Self-dependency detected")
+    if not data:
+        return ORJSONResponse({"status": "dependencies_added"})
+    # Resolve every referenced step in one query
+    str_ids = {d.step_str_id for d in data} | {d.prerequisite_step_str_id for d in data}
+    ids = dict(db.execute(_find_step_ids, {"wid": wf_id, "sids": list(str_ids)}).all())
+    if len(ids) != len(str_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Step or prerequisite not found in workflow")
+    values = [{"step_id": ids[d.step_str_id], "prerequisite_id": ids[d.prerequisite_step_str_id]} for d in data]
+    # Existing dependencies are skipped rather than rejected
+    db.execute(_insert_dependencies, values)
+    db.commit()
+    _bump_version(workflow_str_id)
+    return ORJSONResponse({"status": "dependencies_added"})
 
 # Milestone 1: Get details
-@app.get("/workflows/{workflow_str_id}/details", response_model=WorkflowDetail)
-def get_workflow_details(workflow_str_id: str, db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.workflow_str_id == workflow_str_id).first()
-    if not wf:
+_Prereq = aliased(Step)
+_find_step_prereqs = (
+    select(Dependency.step_id, _Prereq.step_str_id)
+    .join(_Prereq, Dependency.prerequisite_id == _Prereq.id)
+    .join(Step, Dependency.step_id == Step.id)
+    .where(Step.workflow_id == bindparam("wid"))
+    .order_by(Dependency.id)
+)
+_find_steps = (
+    select(Step.id, Step.step_str_id, Step.description)
+    .where(Step.workflow_id == bindparam("wid"))
+    .order_by(Step.id)
+)
+
+@app.get("/workflows/{workflow_str_id}/details", responses={200: {"model": WorkflowDetail}})
+def get_workflow_details(workflow_str_id: str, conn: Connection = Depends(get_ro_conn)):
+    wf = conn.execute(_find_wf, {"wsid": workflow_str_id}).first()
+    if wf is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workflow not found")
-    steps_out = []
-    for step in wf.steps:
-        prereqs = [dep.prerequisite.step_str_id for dep in step.prerequisites]
-        steps_out.append(StepDetail(step_str_id=step.step_str_id, description=step.description, prerequisites=prereqs))
-    return WorkflowDetail(workflow_str_id=wf.workflow_str_id, name=wf.name, steps=steps_out)
+    prereqs: Dict[int, List[str]] = defaultdict(list)
+    for step_id, prereq_str_id in conn.execute(_find_step_prereqs, {"wid": wf.id}):
+        prereqs[step_id].append(prereq_str_id)
+    steps_out = [
+        {"step_str_id": step_str_id, "description": description, "prerequisites": prereqs.get(step_id, [])}
+        for step_id, step_str_id, description in conn.execute(_find_steps, {"wid": wf.id})
+    ]
+    return ORJSONResponse({"workflow_str_id": workflow_str_id, "name": wf.name, "steps": steps_out})
 
 # Milestone 3: Execution order
-@app.get("/workflows/{workflow_str_id}/execution-order", response_model=ExecutionOrder)
-def get_execution_order(workflow_str_id: str, db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.workflow_str_id == workflow_str_id).first()
-    if not wf:
+# Edge count above which mutual dependencies are checked in-database before fetching edges
+CYCLE_CHECK_EDGE_THRESHOLD = 5000
+_COUNT_EDGES_SQL = text(
+    "SELECT COUNT(*) FROM dependencies d JOIN steps s ON s.id = d.step_id "
+    "WHERE s.workflow_id = :wid"
+)
+# A recursive reachability CTE would materialize the transitive closure, which is
+# quadratic on long acyclic chains; an indexed self-join catches two-step cycles cheaply
+_MUTUAL_DEPENDENCY_SQL = text(
+    "SELECT 1 FROM dependencies d JOIN steps s ON s.id = d.step_id "
+    "JOIN dependencies r ON r.step_id = d.prerequisite_id AND r.prerequisite_id = d.step_id "
+    "WHERE s.workflow_id = :wid LIMIT 1"
+)
+# Every step with each of its prerequisites; steps without any come back once with NULL
+_STEP_EDGES_SQL = text(
+    "SELECT s.step_str_id, p.step_str_id FROM steps s "
+    "LEFT JOIN dependencies d ON d.step_id = s.id "
+    "LEFT JOIN steps p ON p.id = d.prerequisite_id "
+    "WHERE s.workflow_id = :wid"
+)
+
+@app.get("/workflows/{workflow_str_id}/execution-order", responses={200: {"model": ExecutionOrder}})
+def get_execution_order(workflow_str_id: str, conn: Connection = Depends(get_ro_conn)):
+    # Read the version before touching the DB so a concurrent mutation can only cause a miss
+    version = _version.get(workflow_str_id, 0)
+    cached = _order_cache.get(workflow_str_id)
+    if cached is not None and cached[0] == version:
+        return Response(content=cached[1], media_type="application/json")
+    wf_id = conn.execute(_find_wf_id, {"wsid": workflow_str_id}).scalar_one_or_none()
+    if wf_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workflow not found")
-    # Build graph
-    steps = {step.step_str_id: step for step in wf.steps}
-    in_degree: Dict[str, int] = {sid: 0 for sid in steps}
-    graph: Dict[str, List[str]] = {sid: [] for sid in steps}
-    for step in wf.steps:
-        for dep in step.prerequisites:
-            src = dep.prerequisite.step_str_id
-            dst = dep.step.step_str_id
+    # Large workflows: reject obvious cycles in SQLite before transferring the edge set
+    edge_count = conn.execute(_COUNT_EDGES_SQL, {"wid": wf_id}).scalar()
+    if edge_count > CYCLE_CHECK_EDGE_THRESHOLD and conn.execute(_MUTUAL_DEPENDENCY_SQL, {"wid": wf_id}).first():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cycle_detected")
+    # Build graph in a single pass over raw (step, prerequisite) tuples, skipping ORM hydration;
+    # steps absent from in_degree have no prerequisites
+    steps = set()
+    graph: Dict[str, List[str]] = defaultdict(list)
+    in_degree: Counter = Counter()
+    for dst, src in conn.execute(_STEP_EDGES_SQL, {"wid": wf_id}):
+        steps.add(dst)
+        if src is not None:
             graph[src].append(dst)
             in_degree[dst] += 1
-    # Kahn's algorithm
-    queue = [sid for sid, deg in in_degree.items() if deg == 0]
+    # Kahn's algorithm; the heap releases ready steps in step_str_id order so output is deterministic
+    heap = [sid for sid in steps if not in_degree[sid]]
+    heapq.heapify(heap)
     order = []
-    while queue:
-        node = queue.pop(0)
+    while heap:
+        node = heapq.heappop(heap)
         order.append(node)
-        for neighbor in graph[node]:
+        for neighbor in graph.get(node, ()):
             in_degree[neighbor] -= 1
             if in_degree[neighbor] == 0:
-                queue.append(neighbor)
+                heapq.heappush(heap, neighbor)
     if len(order) != len(steps):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cycle_detected")
-    return {"order": order}
+    body = orjson.dumps({"order": order})
+    _order_cache[workflow_str_id] = (version, body)
+    return Response(content=body, media_type="application/json")
 
 # Root endpoint
+_ROOT_BYTES = orjson.dumps({"message": "Workflow Definition API is running"})
+
 @app.get("/")
-def read_root():
-    return {"message": "Workflow Definition API is running"}
+async def read_root():
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 # To run: uvicorn app:app --reload